@@ -0,0 +1,378 @@
+'''
+암 발생률/사망률 히트맵 앱의 공용 함수 (한글 폰트, 데이터 로딩, 히트맵 렌더링)
+'''
+
+import matplotlib
+matplotlib.use('Agg')  # 헤드리스 서버용 비대화형 백엔드 (다른 모듈이 pyplot을 import하기 전에 지정)
+
+import streamlit as st
+import pandas as pd
+import numpy as np
+import matplotlib.font_manager as fm
+from matplotlib.figure import Figure
+import platform
+import os
+import codecs
+import chardet
+import io
+import re
+import tempfile
+import threading
+
+# -----------------------------------------------------------
+# 0. [설정] 분석할 공통 암종 리스트 (표준 명칭 정의)
+# -----------------------------------------------------------
+COMMON_CANCERS = (
+    "위암", "대장암", "폐암", "간암", "유방암", 
+    "자궁경부암", "전립선암", "췌장암", "백혈병", 
+    "방광암", "난소암"
+)
+TARGET_YEARS = tuple(range(1999, 2024))
+_TARGET_YEARS_ARR = np.array(TARGET_YEARS, dtype=np.int16)  # 열 번호 조회(year_index)용 정렬 배열
+
+# 원본 파일별 암종명 -> 표준 명칭 (범주 이름에만 적용되므로 호출마다 다시 만들 필요 없음)
+MAPPING_INC = {
+    '위': '위암', '대장': '대장암', '폐': '폐암', '간': '간암',
+    '유방': '유방암', '자궁경부': '자궁경부암', '전립선': '전립선암',
+    '췌장': '췌장암', '백혈병': '백혈병', '방광': '방광암',
+    '난소': '난소암', '갑상선': '갑상선암'
+}
+MAPPING_DEATH = {
+    '위암': '위암', '대장·직장·항문암': '대장암', '기관·기관지·폐암': '폐암',
+    '간암': '간암', '여성 유방암': '유방암', '자궁경부암': '자궁경부암',
+    '전립선암': '전립선암', '췌장암': '췌장암', '백혈병': '백혈병',
+    '방광암': '방광암', '난소암': '난소암'
+}
+
+# 국가/성별 표기 (정규식 대신 정확히 일치하는 값으로 필터링)
+KOREA_LABELS = {'한국', '대한민국', 'Korea', 'Republic of Korea'}
+MALE_LABELS = {'남자', '남', '남성'}
+FEMALE_LABELS = {'여자', '여', '여성'}
+SEX_NAMES = ('남성', '여성')  # 표준 성별 표기 (사망률 텐서의 성별 축 순서)
+
+# 이 크기를 넘는 CSV는 한 번에 올리지 않고 청크 단위로 읽으며 행을 걸러냄
+LARGE_CSV_BYTES = 64 * 1024 * 1024
+CSV_CHUNK_ROWS = 200_000
+
+# Parquet 캐시 파일 권한 계산용 umask (프로세스 전역 값이므로 스레드가 뜨기 전 import 시 한 번만 조회)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+# -----------------------------------------------------------
+# 1. 한글 폰트 설정
+# -----------------------------------------------------------
+# 폰트 등록(TTF 파싱)은 프로세스당 한 번만 수행 (모듈 재로드에도 유지되도록 cache_resource 사용)
+@st.cache_resource(show_spinner=False)
+def _korean_font_name():
+    font_path = 'NanumGothic.ttf'
+    if os.path.exists(font_path):
+        # 캐시를 비운 뒤 다시 호출되어도 fontManager에 중복 등록하지 않음
+        if not any(f.fname == font_path for f in fm.fontManager.ttflist):
+            fm.fontManager.addfont(font_path)
+        return fm.FontProperties(fname=font_path).get_name()
+
+    return {'Darwin': 'AppleGothic', 'Windows': 'Malgun Gothic'}.get(platform.system(), 'NanumGothic')
+
+def set_korean_font():
+    matplotlib.rcParams['font.family'] = _korean_font_name()
+    matplotlib.rcParams['axes.unicode_minus'] = False
+
+# -----------------------------------------------------------
+# 2. 데이터 불러오기 및 전처리 함수
+# -----------------------------------------------------------
+def detect_encoding(filename):
+    # 앞부분 64KB만 읽어 인코딩을 한 번만 판단 (BOM / UTF-8을 먼저 확인하고, 아니면 chardet)
+    with open(filename, 'rb') as f:
+        head = f.read(65536)
+    if head.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    try:
+        # 증분 디코더를 사용하여 64KB 경계에서 잘린 멀티바이트 문자는 무시
+        codecs.getincrementaldecoder('utf-8')().decode(head)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+
+    encoding = chardet.detect(head)['encoding'] or 'cp949'
+    # EUC-KR로 판정되어도 확장 완성형 한글이 섞일 수 있으므로 상위 집합인 cp949로 읽음
+    return 'cp949' if encoding.lower() in ('euc-kr', 'uhc') else encoding
+
+def read_csv_safe(filename, usecols=None, dtype=None, row_filter=None):
+    if not os.path.exists(filename):
+        return None
+    try:
+        encoding = detect_encoding(filename)
+        if callable(usecols):
+            # pyarrow 엔진은 함수형 usecols를 지원하지 않으므로 헤더만 먼저 읽어 목록으로 변환
+            header = pd.read_csv(filename, encoding=encoding, nrows=0).columns
+            usecols = [c for c in header if usecols(c)]
+
+        if row_filter is not None and os.path.getsize(filename) > LARGE_CSV_BYTES:
+            # 큰 파일은 나눠 읽으면서 필요한 행만 남김 (pyarrow 엔진은 chunksize 미지원)
+            # (한 번에 읽는 경로와 같은 Arrow 기반 컬럼을 돌려주도록 dtype_backend를 맞춤)
+            chunks = pd.read_csv(filename, encoding=encoding, usecols=usecols, dtype=dtype,
+                                 dtype_backend='pyarrow', chunksize=CSV_CHUNK_ROWS)
+            df = pd.concat([row_filter(chunk) for chunk in chunks], ignore_index=True)
+            # 청크마다 범주가 달라 concat 시 풀린 범주형 컬럼을 다시 지정 (파일에 없는 컬럼은 제외)
+            return df.astype({c: t for c, t in (dtype or {}).items()
+                              if t == 'category' and c in df.columns})
+
+        df = pd.read_csv(filename, encoding=encoding, engine='pyarrow',
+                         dtype_backend='pyarrow', usecols=usecols, dtype=dtype)
+        return df if row_filter is None else row_filter(df)
+    except (UnicodeDecodeError, pd.errors.ParserError, pd.errors.EmptyDataError, OSError):
+        # 파일 자체를 해독/파싱할 수 없는 경우에만 None (컬럼명 변경, dtype 오류, 코드 버그 등은 그대로 발생)
+        return None
+
+def _load_or_build(csv_path, parquet_path, builder):
+    # 전처리가 끝난 결과를 Parquet으로 저장해 두고, 원본 CSV와 이 모듈보다 최신이면 그대로 사용
+    # (모듈 mtime도 비교하여 전처리 로직이 바뀌면 캐시를 다시 만듦)
+    if not os.path.exists(csv_path):
+        return None
+    source_mtime = max(os.path.getmtime(csv_path), os.path.getmtime(__file__))
+    if os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= source_mtime:
+        try:
+            return pd.read_parquet(parquet_path, engine='pyarrow')
+        except Exception:
+            pass
+
+    df = builder(csv_path)
+    if df is not None:
+        tmp_path = None
+        try:
+            # 프로세스마다 고유한 임시 파일에 쓴 뒤 교체하여 쓰다 만(또는 섞인) 파일을 읽지 않도록 함
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(parquet_path) or '.',
+                                            suffix='.parquet.tmp')
+            os.close(fd)
+            df.to_parquet(tmp_path, engine='pyarrow', compression='zstd', index=False)
+            # mkstemp은 0600으로 만들므로 직접 만든 파일처럼 umask를 적용한 권한으로 맞춤
+            os.chmod(tmp_path, 0o666 & ~_UMASK)
+            os.replace(tmp_path, parquet_path)
+            tmp_path = None
+        except OSError:
+            pass  # 읽기 전용 환경에서는 캐시 파일 없이 진행
+        finally:
+            # 예외 종류와 관계없이 교체되지 못한 임시 파일은 남기지 않음
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+    return df
+
+# 사망률 파일의 연도 컬럼 이름 ('1999 년' 또는 '1999')
+YEAR_RE = re.compile(r'^\s*(\d{4})\s*년?\s*$')
+
+def is_year_column(col):
+    return YEAR_RE.match(str(col)) is not None
+
+def year_index(years):
+    # 연도 -> 히트맵 열 번호 (TARGET_YEARS 밖의 연도는 -1, 암종 행 번호는 범주 코드를 사용)
+    # 연도 축은 정렬된 정수 배열이므로 dict 조회 대신 searchsorted로 한 번에 구함
+    years = np.asarray(years, dtype=np.intp)
+    ci = np.searchsorted(_TARGET_YEARS_ARR, years).clip(max=len(TARGET_YEARS) - 1)
+    return np.where(_TARGET_YEARS_ARR[ci] == years, ci, -1)
+
+def filter_all_ages(df):
+    # 읽는 즉시 '연령전체' 행만 남겨 이후 처리량을 줄임 (범주 코드 하나와의 정수 비교)
+    categories = df['연령군'].cat.categories
+    if '연령전체' not in categories:
+        return df.iloc[:0]
+    return df[df['연령군'].cat.codes.to_numpy() == categories.get_loc('연령전체')]
+
+def filter_korea(df):
+    if '국가' not in df.columns:
+        return df
+    return df[df['국가'].isin(KOREA_LABELS)]
+
+def _recode(series, lookup, categories, ordered=False):
+    # 범주형 컬럼을 새 범주로 다시 매김: lookup[i]는 기존 i번째 범주의 새 코드 (-1 = NaN)
+    # 범주 단위로 정한 코드를 행의 코드에만 치환하므로 행 단위 문자열 처리가 없고,
+    # 이름을 바꾸지 않으므로 여러 표기가 같은 범주로 모여도 범주가 중복되지 않음
+    codes = np.append(lookup, -1)[series.cat.codes.to_numpy()]  # 원래 NaN(코드 -1)은 그대로 NaN
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories, ordered=ordered),
+                     index=series.index)
+
+def to_common_cancers(series, mapping):
+    # COMMON_CANCERS 순서로 범주를 고정 -> 범주 코드가 곧 히트맵 행 번호 (그 외 암종은 NaN)
+    index = {name: i for i, name in enumerate(COMMON_CANCERS)}
+    lookup = np.array([index.get(mapping.get(c), -1) for c in series.cat.categories], dtype=np.intp)
+    return _recode(series, lookup, COMMON_CANCERS, ordered=True)
+
+def normalize_sex(series):
+    # '남자'/'남'/'남성' 등의 표기를 SEX_NAMES 범주로 통일 (남녀전체 등은 NaN)
+    categories = series.cat.categories
+    lookup = np.select([categories.isin(MALE_LABELS), categories.isin(FEMALE_LABELS)], [0, 1], -1)
+    return _recode(series, lookup, SEX_NAMES)
+
+# (1) 조발생률 데이터 전처리
+def build_incidence_data(filename):
+    df = read_csv_safe(
+        filename,
+        usecols=['발생연도', '성별', '암종', '연령군', '조발생률'],
+        dtype={'발생연도': 'string', '암종': 'category', '성별': 'category', '연령군': 'category',
+               '조발생률': 'float32'},
+        row_filter=filter_all_ages
+    )
+    
+    if df is None:
+        return None
+
+    # '1999-2023' 같은 누계 행은 숫자 변환 시 NaN이 되므로 한 번의 변환으로 걸러냄
+    years = pd.to_numeric(df['발생연도'], errors='coerce')
+    df = df.loc[years.notna()].assign(발생연도=years.dropna().astype('int16'))
+    
+    # 범주 이름만 표준 암종명으로 교체 (캐시된 객체를 화면 코드에서 수정하지 않도록 여기서 한 번만)
+    df['암종'] = to_common_cancers(df['암종'], MAPPING_INC)
+    df['성별'] = normalize_sex(df['성별'])
+    # 범주 코드 -1 = COMMON_CANCERS 외 암종 / 남녀전체
+    df = df[(df['암종'].cat.codes.to_numpy() >= 0) & (df['성별'].cat.codes.to_numpy() >= 0)]
+    
+    return df
+
+# (2) 사망률 데이터 전처리
+def build_death_data(filename):
+    df = read_csv_safe(
+        filename,
+        usecols=lambda c: c in ('국가', '성별', '항목') or is_year_column(c),
+        dtype={'국가': 'category', '성별': 'category', '항목': 'category'},
+        row_filter=filter_korea
+    )
+    
+    if df is None:
+        return None
+
+    df = df.rename(columns={'항목': '암종'})
+    df['암종'] = to_common_cancers(df['암종'], MAPPING_DEATH)
+    df = df[df['암종'].notna()]
+
+    # 넓은 형태(행: 성별x암종, 열: 연도)를 그대로 배열로 꺼내 (성별, 암종, 연도) 텐서에 누적
+    # (melt -> 문자열 연도 정리 -> groupby 과정을 한 번의 누적으로 대체)
+    year_cols = [c for c in df.columns if is_year_column(c)]
+    year_map = {c: int(YEAR_RE.match(str(c)).group(1)) for c in year_cols}  # '1999 년' -> 1999
+
+    values = df[year_cols].apply(pd.to_numeric, errors='coerce').to_numpy(np.float32, na_value=0)
+
+    sex_idx = normalize_sex(df['성별']).cat.codes.to_numpy().astype(np.intp)
+    cancer_idx = df['암종'].cat.codes.to_numpy().astype(np.intp)
+    year_idx = year_index([year_map[c] for c in year_cols])
+
+    rows = (sex_idx >= 0) & (cancer_idx >= 0)
+    cols = year_idx >= 0
+    tensor = np.zeros((len(SEX_NAMES), len(COMMON_CANCERS), len(TARGET_YEARS)), dtype=np.float32)
+    index = (sex_idx[rows][:, None], cancer_idx[rows][:, None], year_idx[cols][None, :])
+
+    # (성별, 암종) 행과 연도 열이 겹치지 않으면 누적 없이 한 번에 대입 (np.add.at은 느림)
+    row_keys = sex_idx[rows] * len(COMMON_CANCERS) + cancer_idx[rows]
+    if len(np.unique(row_keys)) == len(row_keys) and len(np.unique(year_idx[cols])) == cols.sum():
+        tensor[index] = values[rows][:, cols]
+    else:
+        np.add.at(tensor, index, values[rows][:, cols])  # 같은 (성별, 암종) 행이 여러 번 나오면 합산
+
+    # 텐서를 그대로 (성별 x 암종) 행, 연도 열의 넓은 표로 반환 (Parquet 열 이름은 문자열이어야 함)
+    # 각 행의 위치는 성별/암종 범주 코드로 기록되므로 death_tensor()가 행 순서에 기대지 않음
+    df_final = pd.DataFrame(tensor.reshape(-1, len(TARGET_YEARS)), columns=[str(y) for y in TARGET_YEARS])
+    df_final.insert(0, '성별', pd.Categorical(np.repeat(SEX_NAMES, len(COMMON_CANCERS)), categories=SEX_NAMES))
+    df_final.insert(1, '암종', pd.Categorical(np.tile(COMMON_CANCERS, len(SEX_NAMES)),
+                                            categories=COMMON_CANCERS, ordered=True))
+
+    return df_final
+
+def death_tensor(df):
+    # build_death_data의 넓은 표 -> (성별, 암종, 연도) 텐서 (각 성별 조각이 곧 히트맵 행렬)
+    # 성별/암종은 SEX_NAMES/COMMON_CANCERS 순서의 범주형이므로 범주 코드를 그대로 축 번호로 사용
+    values = df[[str(y) for y in TARGET_YEARS]].to_numpy(np.float32, na_value=0)
+    tensor = np.zeros((len(SEX_NAMES), len(COMMON_CANCERS), len(TARGET_YEARS)), dtype=np.float32)
+    tensor[df['성별'].cat.codes.to_numpy(), df['암종'].cat.codes.to_numpy()] = values
+    return tensor
+
+# (3) 히트맵용 (암종 x 연도) 행렬 생성
+def build_heatmap_matrix(data, value_col):
+    # 출력 크기가 (암종 x 연도)로 고정되어 있으므로 pivot_table 대신 배열에 직접 누적
+    # 암종은 COMMON_CANCERS 순서의 범주형이므로 범주 코드를 그대로 행 번호로 사용
+    ri = data['암종'].cat.codes.to_numpy()
+    ci = year_index(data['발생연도'].to_numpy())
+    values = data[value_col].to_numpy(dtype=np.float32, na_value=np.nan)
+    mask = (ri >= 0) & (ci >= 0) & ~np.isnan(values)
+    out = np.zeros((len(COMMON_CANCERS), len(TARGET_YEARS)), dtype=np.float32)
+    np.add.at(out, (ri[mask], ci[mask]), values[mask])
+    out.setflags(write=False)  # 캐시 객체를 공유하므로 읽기 전용으로 고정
+    return out
+
+# (4) 데이터 로더 (Parquet -> CSV 순으로 조회)
+def load_incidence_data():
+    return _load_or_build('data_incidence.csv', 'data_incidence.parquet', build_incidence_data)
+
+def load_death_data():
+    return _load_or_build('data_death.csv', 'data_death.parquet', build_death_data)
+
+# (5) 화면에 쓰는 (지표, 성별) 4가지 행렬을 시작 시 한 번에 만들어 보관
+#     재실행 시에는 dict 조회만 하고, 원본 프레임은 메모리에 남기지 않음
+#     결과는 읽기 전용으로만 사용하므로 복사/해시 검증이 없는 cache_resource에 보관
+#     (ttl이 없으므로 CSV를 수정해도 사이드바의 캐시 지우기 또는 프로세스 재시작 전까지는 반영되지 않음,
+#      Parquet 캐시의 mtime 비교는 이 함수가 처음 실행될 때에만 적용됨)
+@st.cache_resource(ttl=None)
+def load_heatmap_matrices():
+    df_inc = load_incidence_data()
+    df_death = load_death_data()
+    if df_inc is None or df_death is None:
+        return None
+
+    matrices = {}
+    tensor = death_tensor(df_death)
+    for s, sex in enumerate(SEX_NAMES):
+        matrices[('조발생률', sex)] = build_heatmap_matrix(df_inc[df_inc['성별'].eq(sex)], '조발생률')
+        # 사망률은 저장된 텐서의 성별 조각을 그대로 사용 (다시 누적하지 않음)
+        matrix = tensor[s].copy()
+        matrix.setflags(write=False)  # 캐시 객체를 공유하므로 읽기 전용으로 고정
+        matrices[('사망률', sex)] = matrix
+    return matrices
+
+# -----------------------------------------------------------
+# 3. 히트맵 그리기 함수 (상하 배치에 맞춰 사이즈 조절)
+# -----------------------------------------------------------
+# 성별 패널 색상 (SEX_NAMES 순서로 위에서 아래로 배치)
+SEX_CMAPS = {'남성': 'Blues', '여성': 'Reds'}
+
+# 지표마다 Figure 하나를 프로세스 전체에서 재사용 (Figure는 피클할 수 없으므로 cache_resource)
+# pyplot 레지스트리 밖에서 만들고, 여러 세션이 동시에 그리지 않도록 lock을 함께 보관
+@st.cache_resource
+def get_heatmap_figure(kind):
+    # [핵심] 상하 배치를 위해 그래프의 가로 길이를 대폭 늘립니다 (10 -> 14)
+    # 남성/여성 두 히트맵을 한 Figure에 위아래로 그려 레이아웃/인코딩을 한 번만 수행 (6 x 2 -> 12)
+    return Figure(figsize=(14, 12), layout='constrained'), threading.Lock()
+
+def draw_heatmap(ax, matrix, title, cmap, label):
+    # 격자가 고정된 정규 격자이므로 pcolormesh(seaborn) 대신 이미지 한 장으로 그림
+    im = ax.imshow(matrix, aspect='auto', cmap=cmap, interpolation='nearest')
+    ax.figure.colorbar(im, ax=ax, label=label)
+
+    ax.set_xticks(range(len(TARGET_YEARS)))
+    ax.set_xticklabels(TARGET_YEARS, rotation=90)
+    ax.set_yticks(range(len(COMMON_CANCERS)))
+    ax.set_yticklabels(COMMON_CANCERS)
+
+    # 셀 구분선은 보조 눈금 격자로 표현 (셀마다 선을 그리지 않음)
+    ax.set_xticks(np.arange(-.5, len(TARGET_YEARS)), minor=True)
+    ax.set_yticks(np.arange(-.5, len(COMMON_CANCERS)), minor=True)
+    ax.grid(which='minor', color='white', linewidth=.5)
+    ax.tick_params(which='minor', length=0)
+    ax.spines[:].set_visible(False)
+    
+    ax.set_title(title, fontsize=16, fontweight='bold', pad=20)
+    ax.set_xlabel("연도", fontsize=12)
+    ax.set_ylabel("암종", fontsize=12)
+
+# 입력이 (지표, 성별별 행렬)로 결정되므로 렌더링된 PNG 바이트를 캐시하여 재실행 시 그리기 생략
+# (행렬은 SEX_NAMES 순서의 bytes 튜플 + shape로 넘겨 캐시 키 해시를 가볍게 유지)
+@st.cache_data(show_spinner=False)
+def render_heatmap_png(kind, matrix_bytes, shape):
+    fig, lock = get_heatmap_figure(kind)
+
+    buf = io.BytesIO()
+    with lock:
+        # 이전 그림의 축과 컬러바를 모두 지우고 같은 Figure에 다시 그림
+        fig.clear()
+        axes = fig.subplots(len(SEX_NAMES), 1)
+        for ax, sex, data in zip(axes, SEX_NAMES, matrix_bytes):
+            matrix = np.frombuffer(data, dtype=np.float32).reshape(shape)
+            draw_heatmap(ax, matrix, f"{sex} {kind} 추이", SEX_CMAPS[sex], kind)
+        fig.savefig(buf, format='png', dpi=110, bbox_inches='tight')
+    return buf.getvalue()